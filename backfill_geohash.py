@@ -0,0 +1,62 @@
+# One-off backfill for documents written before geohash indexing: stores the missing
+# geohash on users and products and adds every located user to geohash_index.
+# Safe to re-run; index entries are added with ArrayUnion.
+# Usage: python backfill_geohash.py
+import asyncio
+import pygeohash as pgh
+from google.cloud.firestore import ArrayUnion, GeoPoint
+from geo import GEOHASH_PRECISION, INDEX_CELL_PRECISION
+from main import MAX_BATCH_WRITES, get_db
+
+
+# Commits writes in batches of at most MAX_BATCH_WRITES
+class BatchWriter:
+    def __init__(self):
+        self.batch = get_db().batch()
+        self.writes = 0
+
+    async def add(self, write, *args, **kwargs):
+        if self.writes == MAX_BATCH_WRITES:
+            await self.flush()
+        getattr(self.batch, write)(*args, **kwargs)
+        self.writes += 1
+
+    async def flush(self):
+        if self.writes:
+            await self.batch.commit()
+        self.batch = get_db().batch()
+        self.writes = 0
+
+
+async def backfill():
+    writer = BatchWriter()
+
+    users = 0
+    async for user in get_db().collection('users').stream():
+        data = user.to_dict()
+        loc = data.get('location')
+        if not loc:
+            continue
+        geohash = data.get('geohash')
+        if not geohash:
+            geohash = pgh.encode(loc['latitude'], loc['longitude'], precision=GEOHASH_PRECISION)
+            await writer.add('update', user.reference, {'geohash': geohash})
+        cell_ref = get_db().collection('geohash_index').document(geohash[:INDEX_CELL_PRECISION])
+        await writer.add('set', cell_ref, {'user_ids': ArrayUnion([user.id])}, merge=True)
+        users += 1
+
+    products = 0
+    async for product in get_db().collection('products').stream():
+        data = product.to_dict()
+        loc = data.get('location')
+        if isinstance(loc, GeoPoint) and not data.get('geohash'):
+            geohash = pgh.encode(loc.latitude, loc.longitude, precision=GEOHASH_PRECISION)
+            await writer.add('update', product.reference, {'geohash': geohash})
+            products += 1
+
+    await writer.flush()
+    print(f"Indexed {users} users, added geohash to {products} products")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,93 @@
+import math
+import numpy as np
+import pygeohash as pgh
+
+GEOHASH_PRECISION = 9  # ~5m x 5m cells stored alongside each location
+INDEX_CELL_PRECISION = 5  # ~5km x 5km cells in the geohash_index collection
+MAX_INDEX_CELLS = 100  # Beyond this many cells, radius queries fall back to geohash ranges
+KM_PER_DEGREE = math.pi * 6371 / 180  # Same Earth radius as haversine_vec
+
+# Helper function to calculate distances from one point to many (vectorized Haversine formula)
+# All arithmetic runs in place on three buffers, and 2*asin(sqrt(a)) replaces 2*atan2(sqrt(a), sqrt(1-a))
+def haversine_vec(lat0, lng0, lats, lngs):
+    R = 6371  # Earth radius in kilometers
+    lat0 = math.radians(lat0)
+    lats = np.radians(lats)
+
+    # sin^2(dlat / 2)
+    a = lats - lat0
+    a *= 0.5
+    np.sin(a, out=a)
+    np.square(a, out=a)
+
+    # cos(lat0) * cos(lat) * sin^2(dlng / 2)
+    dlng = np.radians(lngs)
+    dlng -= math.radians(lng0)
+    dlng *= 0.5
+    np.sin(dlng, out=dlng)
+    np.square(dlng, out=dlng)
+    np.cos(lats, out=lats)
+    dlng *= lats
+    dlng *= math.cos(lat0)
+    a += dlng
+
+    np.minimum(a, 1, out=a)  # Rounding can push a just past 1 for antipodal points
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * R
+    return a
+
+# Height and width in degrees of a geohash cell at the given precision
+def geohash_cell_size(precision):
+    bits = 5 * precision
+    lat_bits = bits // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** (bits - lat_bits)
+
+# Geohash ranges covering a circle of radius km around (lat, lng): the cell holding the
+# centre plus its 8 neighbours, at the finest precision whose cells span the radius
+def geohash_query_bounds(lat, lng, radius):
+    # Longitude degrees shrink towards the poles, so size cells for the worst latitude
+    max_lat = min(abs(lat) + radius / KM_PER_DEGREE, 89.9)
+    lng_km = KM_PER_DEGREE * math.cos(math.radians(max_lat))
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        if height * KM_PER_DEGREE >= radius and width * lng_km >= radius:
+            break
+    else:
+        return [('', '~')]  # Radius wider than a precision-1 cell: match every geohash
+
+    cells = {
+        pgh.encode(
+            min(max(lat + dlat * height, -90), 90),
+            (lng + dlng * width + 180) % 360 - 180,
+            precision=precision,
+        )
+        for dlat in (-1, 0, 1)
+        for dlng in (-1, 0, 1)
+    }
+    return [(cell, cell + '~') for cell in sorted(cells)]
+
+# Geohash cells of the given precision covering the bounding box of a circle of radius km
+# around (lat, lng), or None when more than MAX_INDEX_CELLS would be needed
+def geohash_cells_covering(lat, lng, radius, precision):
+    if not all(math.isfinite(value) for value in (lat, lng, radius)):
+        return None
+
+    height, width = geohash_cell_size(precision)
+    dlat = radius / KM_PER_DEGREE
+    dlng = radius / (KM_PER_DEGREE * math.cos(math.radians(min(abs(lat) + dlat, 89.9))))
+
+    # Count the samples before building them, so a huge radius costs nothing
+    if (math.ceil(2 * dlat / height) + 1) * (math.ceil(2 * dlng / width) + 1) > MAX_INDEX_CELLS:
+        return None
+
+    # Sampling every cell height/width (plus the far edge) hits every cell the box touches
+    lats = np.append(np.arange(lat - dlat, lat + dlat, height), lat + dlat)
+    lngs = np.append(np.arange(lng - dlng, lng + dlng, width), lng + dlng)
+
+    return {
+        pgh.encode(min(max(cell_lat, -90), 90), (cell_lng + 180) % 360 - 180, precision=precision)
+        for cell_lat in lats
+        for cell_lng in lngs
+    }
@@ -1,53 +1,148 @@
-from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from typing import Optional, Dict
-import firebase_admin
-from firebase_admin import credentials, firestore
+from pydantic import BaseModel, field_serializer
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Dict, List
+from google.cloud.firestore import AsyncClient, ArrayUnion, GeoPoint
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+import asyncio
 import hashlib
-import os
+import hmac
+import numpy as np
+import orjson
+import pygeohash as pgh
+from geo import GEOHASH_PRECISION, INDEX_CELL_PRECISION, geohash_cells_covering, geohash_query_bounds, haversine_vec
 from datetime import datetime
 
-# Initialize Firebase
-cred = credentials.Certificate('key.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Initialize Firestore lazily so the module can be imported (e.g. by tests) without credentials
+_db = None
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = AsyncClient.from_service_account_json('key.json')  # Single AsyncClient shares one gRPC channel across requests
+    return _db
+
+# Firestore returns timestamps as a datetime subclass, which orjson does not serialize natively
+def orjson_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+# JSONResponse rendered with orjson (FastAPI's ORJSONResponse is deprecated)
+class FirestoreJSONResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(
+            content,
+            default=orjson_default,
+            option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY,
+        )
 
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(default_response_class=FirestoreJSONResponse)
+
+# Argon2id hasher shared by every request
+ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+MAX_BATCH_WRITES = 500  # Firestore limit on writes per batch commit
+MAX_BULK_PRODUCTS = 5000  # Largest list /products/bulk accepts
+MAX_PAGE_SIZE = 500  # Largest page /products will return
+MAX_RADIUS_KM = 500  # Largest search radius, keeping geohash queries well short of a full scan
 
 # Helper functions
 def serialize_firestore_document(doc):
     data = doc.to_dict()
     data['id'] = doc.id
-    for key, value in data.items():
-        if isinstance(value, firestore.GeoPoint):
-            data[key] = {
-                "latitude": value.latitude,
-                "longitude": value.longitude
-            }
+    # 'location' is the only GeoPoint field we store
+    loc = data.get('location')
+    if isinstance(loc, GeoPoint):
+        data['location'] = {
+            "latitude": loc.latitude,
+            "longitude": loc.longitude
+        }
+    return data
+
+# User documents without the password hash and the internal geohash
+def serialize_user(doc):
+    data = doc.to_dict()
+    data.pop('password', None)
+    data.pop('geohash', None)
     return data
 
 def hash_password(password):
-    salt = os.urandom(16)
-    hashed_password = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
-    return salt + hashed_password  # Combine salt and hashed password
+    # Encoded string carries the salt and Argon2 parameters
+    return ph.hash(password)
 
 def verify_password(password, stored_password):
-    salt = stored_password[:16]
-    stored_hash = stored_password[16:]
-    hashed_password = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
-    return hashed_password == stored_hash
+    # Users registered before the Argon2 switch still hold salt + PBKDF2 bytes
+    if isinstance(stored_password, bytes):
+        salt = stored_password[:16]
+        stored_hash = stored_password[16:]
+        hashed_password = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
+        return hmac.compare_digest(hashed_password, stored_hash)
+    try:
+        return ph.verify(stored_password, password)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
 
-# Helper function to calculate distance between two coordinates (Haversine formula)
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in kilometers
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Coordinates of a snapshot's location (a GeoPoint or a latitude/longitude map), NaN if it has none
+def document_coords(doc):
+    try:
+        loc = doc.get('location')
+    except KeyError:
+        loc = None
+    if loc is None:
+        return np.nan, np.nan
+    if isinstance(loc, GeoPoint):
+        return loc.latitude, loc.longitude
+    return loc['latitude'], loc['longitude']
+
+# Keep the snapshots within radius km of (lat, lng), serialized and annotated with their distance.
+# Only the coordinates are read up front; the full document is built for matches alone.
+# float32 keeps distances within about a metre, well inside any radius tolerance, at half the bandwidth.
+def filter_by_radius(docs, lat, lng, radius, serialize):
+    coords = np.array([document_coords(doc) for doc in docs], dtype=np.float32).reshape(-1, 2)
+    distances = haversine_vec(lat, lng, coords[:, 0], coords[:, 1])
+
+    nearby = []
+    for i in np.flatnonzero(distances <= radius):  # NaN distances never match
+        data = serialize(docs[i])
+        data['distance'] = float(distances[i])
+        nearby.append(data)
+    return nearby
+
+# Fetch the documents of a collection whose geohash falls in [lower, upper]
+async def stream_geohash_range(collection, lower, upper):
+    query = get_db().collection(collection).where('geohash', '>=', lower).where('geohash', '<=', upper)
+    return [doc async for doc in query.stream()]
+
+# Fetch the documents of a collection whose geohash lies near (lat, lng), deduplicated
+async def stream_nearby(collection, lat, lng, radius):
+    # Run the range queries concurrently over the shared client
+    results = await asyncio.gather(*(
+        stream_geohash_range(collection, lower, upper)
+        for lower, upper in geohash_query_bounds(lat, lng, radius)
+    ))
+    docs = {doc.id: doc for result in results for doc in result}
+    return list(docs.values())
+
+# Fetch the users near (lat, lng) through the geohash_index cells instead of range queries
+async def fetch_nearby_users(lat, lng, radius):
+    cells = geohash_cells_covering(lat, lng, radius, INDEX_CELL_PRECISION)
+    if cells is None:
+        return await stream_nearby('users', lat, lng, radius)
+
+    index_refs = [get_db().collection('geohash_index').document(cell) for cell in cells]
+    user_ids = set()
+    async for cell in get_db().get_all(index_refs):
+        if cell.exists:
+            user_ids.update(cell.to_dict().get('user_ids', []))
+    if not user_ids:
+        return []
+
+    user_refs = [get_db().collection('users').document(user_id) for user_id in user_ids]
+    return [user async for user in get_db().get_all(user_refs) if user.exists]
 
 
 # Pydantic schema
@@ -57,61 +152,83 @@ class ProductSchema(BaseModel):
     description: str
     price: float
     quantity: int
-    location: Optional[Dict[str, float]]
+    location: Optional[Dict[str, float]] = None
+
+    # Dump location straight to the GeoPoint Firestore stores
+    @field_serializer('location')
+    def _location_to_geopoint(self, loc):
+        return GeoPoint(loc['latitude'], loc['longitude']) if loc else None
 
 # User Schema
 class UserSchema(BaseModel):
     phone_number: str
-    password: Optional[str]
-    email: Optional[str]
-    name: Optional[str]
+    password: Optional[str] = None
+    email: Optional[str] = None
+    name: Optional[str] = None
     type: str
-    description: Optional[str]
-    location: Optional[Dict[str, float]] 
-    focus_area: Optional[str]
+    description: Optional[str] = None
+    location: Optional[Dict[str, float]] = None
+    focus_area: Optional[str] = None
 
-@app.get("/products", response_model=list)
-def get_all_products():
+@app.get("/products")
+async def get_all_products(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
     try:
-        products = db.collection('products').stream()
-        product_list = [serialize_firestore_document(doc) for doc in products]
-        return product_list
+        # Page through products by document id; cursor is the last id of the previous page
+        query = get_db().collection('products').order_by('__name__').limit(limit)
+        if cursor:
+            query = query.start_after({'__name__': cursor})
+        product_list = [serialize_firestore_document(doc) async for doc in query.stream()]
+        return FirestoreJSONResponse(content={
+            "products": product_list,
+            "next_cursor": product_list[-1]['id'] if len(product_list) == limit else None
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/products/{product_id}")
-def get_product_by_id(product_id: str):
+# Registered before /products/{product_id} so the static path is matched first
+@app.get("/products/location")
+async def get_products_by_location(lat: float, lng: float, radius: float = Query(10, gt=0, le=MAX_RADIUS_KM)):  # Default to 10 km radius
     try:
-        doc = db.collection('products').document(product_id).get()
-        if doc.exists:
-            return {"product": serialize_firestore_document(doc)}
+        # Fetch only the products in the geohash cells around the point
+        docs = await stream_nearby('products', lat, lng, radius)
+        products = filter_by_radius(docs, lat, lng, radius, serialize_firestore_document)
+
+        if products:
+            # Sort by distance (closest first)
+            products.sort(key=lambda x: x['distance'])
+            return FirestoreJSONResponse(content={"products": products})
         else:
-            raise HTTPException(status_code=404, detail="Product not found")
+            raise HTTPException(status_code=404, detail="No products found at the given location")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/products/location")
-def get_products_by_location(lat: float, lng: float):
+@app.get("/products/{product_id}")
+async def get_product_by_id(product_id: str):
     try:
-        geo_point = firestore.GeoPoint(lat, lng)
-        query = db.collection('products').where('location', '==', geo_point).stream()
-        products = [serialize_firestore_document(doc) for doc in query]
-
-        if products:
-            return {"products": products}
+        doc = await get_db().collection('products').document(product_id).get()
+        if doc.exists:
+            return FirestoreJSONResponse(content={"product": serialize_firestore_document(doc)})
         else:
-            raise HTTPException(status_code=404, detail="No products found at the given location")
+            raise HTTPException(status_code=404, detail="Product not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Firestore document for a product, with its location stored as a GeoPoint
+def product_to_document(product):
+    product_dict = product.model_dump()
+    loc = product_dict['location']
+    if loc:
+        product_dict['geohash'] = pgh.encode(loc.latitude, loc.longitude, precision=GEOHASH_PRECISION)
+    return product_dict
+
 @app.post("/products")
-def create_product(product: ProductSchema):
+async def create_product(product: ProductSchema):
     try:
-        product_dict = product.dict()
-        if 'location' in product_dict and product_dict['location']:
-            loc = product_dict.pop('location')
-            product_dict['location'] = firestore.GeoPoint(loc['latitude'], loc['longitude'])
-        doc_ref = db.collection('products').add(product_dict)
+        doc_ref = await get_db().collection('products').add(product_to_document(product))
         return {
             "success": True,
             "message": "Product created successfully",
@@ -120,124 +237,130 @@ def create_product(product: ProductSchema):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/products/bulk")
+async def create_products_bulk(products: List[ProductSchema]):
+    if len(products) > MAX_BULK_PRODUCTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_PRODUCTS} products per request")
+
+    collection = get_db().collection('products')
+    doc_refs = [collection.document() for _ in products]
+    committed_ids = []
+    try:
+        # One batch per MAX_BATCH_WRITES products, committed in order so a failure
+        # leaves a known prefix of the products written
+        for start in range(0, len(products), MAX_BATCH_WRITES):
+            end = start + MAX_BATCH_WRITES
+            batch = get_db().batch()
+            for doc_ref, product in zip(doc_refs[start:end], products[start:end]):
+                batch.create(doc_ref, product_to_document(product))
+            await batch.commit()
+            committed_ids.extend(doc_ref.id for doc_ref in doc_refs[start:end])
+
+        return {
+            "success": True,
+            "message": "Products created successfully",
+            "ids": committed_ids
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail={"message": str(e), "committed_ids": committed_ids})
+
 @app.delete("/products/{product_id}")
-def delete_product(product_id: str):
+async def delete_product(product_id: str):
     try:
-        doc_ref = db.collection('products').document(product_id)
-        doc_ref.delete()
+        doc_ref = get_db().collection('products').document(product_id)
+        await doc_ref.delete()
         return {"success": True, "message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Register User
-@app.route('/users/register', methods=['POST'])
-def register_user(user: UserSchema):
+@app.post('/users/register', status_code=201)
+async def register_user(user: UserSchema):
     try:  
-        # Hash the password if provided
-        user_dict = user.dict()
+        # Hash the password if provided, off the event loop since it is CPU-bound
+        user_dict = user.model_dump()
         if user_dict.get("password"):
-            user_dict["password"] = hash_password(user_dict["password"])
-        
+            user_dict["password"] = await run_in_threadpool(hash_password, user_dict["password"])
+
+        doc_ref = get_db().collection('users').document()
+        batch = get_db().batch()
+
+        # Index the location for radius queries, in the same commit as the user
+        loc = user_dict.get("location")
+        if loc:
+            user_dict["geohash"] = pgh.encode(loc['latitude'], loc['longitude'], precision=GEOHASH_PRECISION)
+            cell_ref = get_db().collection('geohash_index').document(user_dict["geohash"][:INDEX_CELL_PRECISION])
+            batch.set(cell_ref, {'user_ids': ArrayUnion([doc_ref.id])}, merge=True)
+
         # Add the user to Firestore
-        doc_ref = db.collection('users').add(user_dict)
+        batch.set(doc_ref, user_dict)
+        await batch.commit()
         return {
             "success": True,
             "message": "User registered successfully",
-            "id": doc_ref[1].id
-        }, 201
+            "id": doc_ref.id
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Find Users by Filters
-@app.route('/users/find', methods=['GET'])
-def find_users(request: Request):
-    query_params = request.query_params
-    user_type = query_params('type')
-    description_keyword = query_params('description')
-    focus_area_keyword = query_params('focus_area')
-    lat = query_params('lat', type=float)
-    lng = query_params('lng', type=float)
-    radius = query_params('radius', type=float)
-
-
-    query = db.collection('users')
-    
-    # Filter by user type
-    if user_type:
-        query = query.where('type', '==', user_type)
-    
-    # Fetch matching users
-    users = query.stream()
+@app.get('/users/find')
+async def find_users(
+    user_type: Optional[str] = Query(None, alias='type'),
+    description: Optional[str] = None,
+    focus_area: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius: Optional[float] = Query(None, gt=0, le=MAX_RADIUS_KM),
+):
+    has_location = lat is not None and lng is not None and radius is not None
+
+    if has_location:
+        # Only the users in the geohash cells around the point and within the radius; type is checked below
+        nearby = await fetch_nearby_users(lat, lng, radius)
+        users = filter_by_radius(nearby, lat, lng, radius, serialize_user)
+    else:
+        query = get_db().collection('users')
+
+        # Filter by user type
+        if user_type:
+            query = query.where('type', '==', user_type)
+
+        # Fetch matching users
+        users = [serialize_user(user) async for user in query.stream()]
     filtered_users = []
 
-    for user in users:
-        user_data = user.to_dict()
+    for user_data in users:
+        if user_type and user_data.get('type') != user_type:
+            continue
         
         # Filter by description keyword
-        if description_keyword and description_keyword.lower() not in (user_data.get('description', '').lower()):
+        if description and description.lower() not in (user_data.get('description') or '').lower():
             continue
 
         # Filter by focus area
-        if focus_area_keyword and focus_area_keyword.lower() not in (user_data.get('focus_area', '').lower()):
+        if focus_area and focus_area.lower() not in (user_data.get('focus_area') or '').lower():
             continue
 
-        # Filter by location and radius
-        if lat is not None and lng is not None and radius is not None:
-            user_location = user_data.get('location')
-            if not user_location:
-                continue
-            
-            user_lat = user_location.get('latitude')
-            user_lng = user_location.get('longitude')
-            
-            distance = haversine(lat, lng, user_lat, user_lng)
-            if distance > radius:
-                continue
-            
-            user_data['distance'] = distance  # Include distance in the result
-        
         filtered_users.append(user_data)
-    
-    JSONResponse(content=jsonable_encoder(filtered_users), status_code=status.HTTP_200_SUCCESS)
 
-# Find Users by Location Only
-@app.route('/find_by_location', methods=['GET'])
-def find_users_by_location(request: Request):
-    query_params = request.query_params
-    lat = query_params('lat', type=float)
-    lng = query_params('lng', type=float)
-    radius = query_params('radius', type=float, default=10)  # Default to 10 km radius
-
-    if lat is None or lng is None:
-        raise HTTPException(status_code=400, detail="No products found at the given location")
-
-    # Fetch users with location data
-    users_ref = db.collection('users').where('location', '!=', None).stream()
-    nearby_users = []
-
-    for user in users_ref:
-        user_data = user.to_dict()
-        user_location = user_data.get('location')
-        
-        if not user_location:
-            continue
+    return FirestoreJSONResponse(content=filtered_users)
 
-        user_lat = user_location.get('latitude')
-        user_lng = user_location.get('longitude')
-        distance = haversine(lat, lng, user_lat, user_lng)
-
-        if distance <= radius:
-            user_data['distance'] = distance
-            nearby_users.append(user_data)
+# Find Users by Location Only
+@app.get('/find_by_location')
+async def find_users_by_location(lat: float, lng: float, radius: float = Query(10, gt=0, le=MAX_RADIUS_KM)):  # Default to 10 km radius
+    # Fetch only the users in the geohash cells around the point
+    users_ref = await fetch_nearby_users(lat, lng, radius)
+    nearby_users = filter_by_radius(users_ref, lat, lng, radius, serialize_user)
 
     # Sort by distance (closest first)
     nearby_users.sort(key=lambda x: x['distance'])
 
-    return JSONResponse(content=jsonable_encoder(nearby_users), status_code=status.HTTP_200_SUCCESS)
+    return FirestoreJSONResponse(content=nearby_users)
 
 # Run the application
-if _name_ == "_main_":
+if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import math
+import random
+import tracemalloc
+
+import numpy as np
+import pygeohash as pgh
+import pytest
+
+from geo import geohash_cells_covering, geohash_query_bounds, haversine_vec
+
+
+# Random point at most radius km from (lat, lng), via the great-circle destination formula
+def random_point_within(rng, lat, lng, radius):
+    bearing = rng.uniform(0, 2 * math.pi)
+    d = rng.uniform(0, radius) / 6371
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(bearing))
+    lng2 = lng1 + math.atan2(
+        math.sin(bearing) * math.sin(d) * math.cos(lat1),
+        math.cos(d) - math.sin(lat1) * math.sin(lat2),
+    )
+    return math.degrees(lat2), (math.degrees(lng2) + 180) % 360 - 180
+
+
+# Scalar Haversine in the atan2 form haversine_vec replaced
+def haversine(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * 6371 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def test_haversine_vec_matches_scalar_reference():
+    rng = np.random.default_rng(0)
+    lats, lngs = rng.uniform(-90, 90, 1000), rng.uniform(-180, 180, 1000)
+    expected = [haversine(10, 20, lat, lng) for lat, lng in zip(lats, lngs)]
+    np.testing.assert_allclose(haversine_vec(10, 20, lats, lngs), expected, rtol=0, atol=1e-9)
+
+
+def test_haversine_vec_edge_cases():
+    assert haversine_vec(0, 0, np.array([]), np.array([])).shape == (0,)
+    assert haversine_vec(52.5, 13.4, np.array([52.5]), np.array([13.4]))[0] == 0
+    # Antipodal points must not produce NaN from rounding past a == 1
+    np.testing.assert_allclose(haversine_vec(0, 0, np.array([0.0]), np.array([180.0])), [math.pi * 6371])
+
+
+def test_haversine_vec_leaves_inputs_untouched():
+    lats, lngs = np.array([48.8566]), np.array([2.3522])
+    haversine_vec(52.52, 13.405, lats, lngs)
+    assert lats[0] == 48.8566 and lngs[0] == 2.3522
+
+
+def test_haversine_vec_float32_stays_within_a_metre_locally():
+    rng = np.random.default_rng(1)
+    lats = 52.5 + rng.uniform(-0.5, 0.5, 100000)
+    lngs = 13.4 + rng.uniform(-0.5, 0.5, 100000)
+    exact = haversine_vec(52.52, 13.405, lats, lngs)
+    approx = haversine_vec(52.52, 13.405, lats.astype(np.float32), lngs.astype(np.float32))
+    assert approx.dtype == np.float32
+    assert np.abs(exact - approx).max() < 1e-3  # km
+
+
+def test_geohash_query_bounds_cover_points_within_radius():
+    rng = random.Random(0)
+    for _ in range(2000):
+        lat, lng = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        radius = rng.choice([0.1, 1, 5, 10, 50, 300])
+        bounds = geohash_query_bounds(lat, lng, radius)
+
+        point = pgh.encode(*random_point_within(rng, lat, lng, radius), precision=9)
+        assert any(lower <= point <= upper for lower, upper in bounds), (lat, lng, radius)
+
+
+def test_geohash_query_bounds_wrap_the_antimeridian():
+    bounds = geohash_query_bounds(0, 179.99, 100)
+    point = pgh.encode(0, -179.5, precision=9)
+    assert any(lower <= point <= upper for lower, upper in bounds)
+
+
+def test_geohash_query_bounds_match_everything_for_huge_radius():
+    assert geohash_query_bounds(0, 0, 20000) == [('', '~')]
+
+
+def test_geohash_cells_covering_cover_points_within_radius():
+    rng = random.Random(0)
+    for _ in range(3000):
+        lat, lng = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        radius = rng.choice([0.1, 1, 5, 10, 15])
+        cells = geohash_cells_covering(lat, lng, radius, 5)
+        if cells is None:
+            continue
+
+        point = pgh.encode(*random_point_within(rng, lat, lng, radius), precision=5)
+        assert point in cells, (lat, lng, radius)
+
+
+def test_geohash_cells_covering_gives_up_past_max_cells():
+    assert geohash_cells_covering(0, 0, 10, 5) is not None
+    assert geohash_cells_covering(0, 0, 25, 5) is None
+    assert geohash_cells_covering(60, 0, 15, 5) is None
+
+
+@pytest.mark.parametrize('radius', [20000, 3000000, math.inf, math.nan])
+def test_geohash_cells_covering_rejects_huge_radius_without_allocating(radius):
+    tracemalloc.start()
+    try:
+        assert geohash_cells_covering(0, 0, radius, 5) is None
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 1024
+
+
+def test_geohash_cells_covering_rejects_non_finite_point():
+    assert geohash_cells_covering(math.nan, 0, 10, 5) is None
+    assert geohash_cells_covering(0, math.inf, 10, 5) is None
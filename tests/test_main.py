@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import math
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from google.cloud.firestore import GeoPoint
+
+import main
+
+
+# Minimal stand-in for a Firestore DocumentSnapshot
+class FakeSnapshot:
+    def __init__(self, id, data):
+        self.id = id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+    def get(self, field):
+        return self._data[field]  # Raises KeyError for missing fields, like Firestore
+
+
+# Just enough of the AsyncClient for the product list and bulk endpoints
+class FakeQuery:
+    def __init__(self, client, docs, start_after=None, limit=None):
+        self.client = client
+        self.docs = docs
+        self._start_after = start_after
+        self._limit = limit
+
+    def document(self, id=None):
+        return FakeRef(id or f"id{len(self.client.refs)}", self.client)
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, limit):
+        return FakeQuery(self.client, self.docs, self._start_after, limit)
+
+    def start_after(self, cursor):
+        return FakeQuery(self.client, self.docs, cursor['__name__'], self._limit)
+
+    async def stream(self):
+        docs = sorted(self.docs.items())
+        if self._start_after:
+            docs = [(id, data) for id, data in docs if id > self._start_after]
+        for id, data in docs[:self._limit]:
+            yield FakeSnapshot(id, data)
+
+
+class FakeRef:
+    def __init__(self, id, client):
+        self.id = id
+        client.refs.append(self)
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def create(self, ref, data):
+        self.writes.append((ref, data))
+
+    async def commit(self):
+        self.client.commits.append(len(self.writes))
+
+
+class FakeClient:
+    def __init__(self, docs=None):
+        self.docs = docs or {}
+        self.refs = []
+        self.commits = []
+
+    def collection(self, name):
+        return FakeQuery(self, self.docs)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    def install(docs=None):
+        client = FakeClient(docs)
+        monkeypatch.setattr(main, '_db', client)
+        return client
+    return install
+
+
+def test_serialize_user_drops_password_and_geohash():
+    doc = FakeSnapshot('u1', {'phone_number': '1', 'password': '$argon2id$...', 'geohash': 'u33dc', 'type': 'farmer'})
+    assert main.serialize_user(doc) == {'phone_number': '1', 'type': 'farmer'}
+
+
+def test_filter_by_radius_handles_every_location_form():
+    docs = [
+        FakeSnapshot('map', {'location': {'latitude': 52.53, 'longitude': 13.4}}),
+        FakeSnapshot('geopoint', {'location': GeoPoint(52.52, 13.41)}),
+        FakeSnapshot('null', {'location': None}),
+        FakeSnapshot('missing', {}),
+        FakeSnapshot('far', {'location': {'latitude': 48.8566, 'longitude': 2.3522}}),
+    ]
+    nearby = main.filter_by_radius(docs, 52.52, 13.405, 10, lambda doc: {'id': doc.id})
+
+    assert [doc['id'] for doc in nearby] == ['map', 'geopoint']
+    assert all(isinstance(doc['distance'], float) and doc['distance'] < 2 for doc in nearby)
+
+
+def test_filter_by_radius_without_documents():
+    assert main.filter_by_radius([], 0, 0, 10, main.serialize_user) == []
+
+
+def test_document_coords_missing_location_is_nan():
+    assert all(math.isnan(c) for c in main.document_coords(FakeSnapshot('x', {})))
+
+
+def test_verify_password_argon2():
+    stored = main.hash_password('secret')
+    assert main.verify_password('secret', stored)
+    assert not main.verify_password('wrong', stored)
+    assert not main.verify_password('secret', 'not-a-hash')
+
+
+def test_verify_password_legacy_pbkdf2_bytes():
+    salt = b'0' * 16
+    stored = salt + hashlib.pbkdf2_hmac('sha256', b'secret', salt, 100000)
+    assert main.verify_password('secret', stored)
+    assert not main.verify_password('wrong', stored)
+
+
+def test_get_all_products_next_cursor(fake_db):
+    fake_db({f"p{i}": {'name': str(i)} for i in range(5)})
+
+    page = orjson.loads(asyncio.run(main.get_all_products(limit=2, cursor=None)).body)
+    assert [p['id'] for p in page['products']] == ['p0', 'p1']
+    assert page['next_cursor'] == 'p1'
+
+    page = orjson.loads(asyncio.run(main.get_all_products(limit=2, cursor='p3')).body)
+    assert [p['id'] for p in page['products']] == ['p4']
+    assert page['next_cursor'] is None
+
+
+def test_create_products_bulk_splits_into_batches(fake_db):
+    client = fake_db()
+    products = [main.ProductSchema(name='a', description='b', price=1, quantity=1)] * 1201
+
+    result = asyncio.run(main.create_products_bulk(products))
+
+    assert client.commits == [500, 500, 201]
+    assert len(result['ids']) == 1201
+
+
+@pytest.mark.parametrize('path', ['/find_by_location', '/users/find', '/products/location'])
+@pytest.mark.parametrize('radius', ['-1', '0', '1e9', 'inf', 'nan'])
+def test_radius_search_rejects_bad_radius(path, radius):
+    client = TestClient(main.app)
+    response = client.get(path, params={'lat': 0, 'lng': 0, 'radius': radius})
+    assert response.status_code == 422